@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import atexit
 import json
 import os
 import random
@@ -8,6 +9,11 @@ import time
 import termios
 import tty
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Georgian alphabet and corresponding names
 mkhedruli_alphabet = {
     "ა": "[a]   ani",
@@ -45,58 +51,154 @@ mkhedruli_alphabet = {
     "ჰ": "[h]   hae"
 }
 
+CHARS = tuple(mkhedruli_alphabet)
+NAMES = tuple(sys.intern(name) for name in mkhedruli_alphabet.values())
+CHAR_TO_IDX = {char: i for i, char in enumerate(CHARS)}
+# Highest power of two not above the number of characters, where the
+# weight tree walk in choose_character starts
+WEIGHT_TREE_TOP_STEP = 1 << (len(CHARS).bit_length() - 1)
+
 STATS_FILE = "mkhedruli_stats.json"
+STATS_LOG = "mkhedruli_stats.log"
 num_options = 5
 DISPLAY_OPTIONS_HORIZONTALLY = False
 EXIT_KEY = "0"
+VALID_KEYS = frozenset(str(i) for i in range(1, num_options + 1))
+CLEAR_SCREEN = "\033[H\033[2J"
 
 def clear_screen():
-    os.system('clear')
+    sys.stdout.write(CLEAR_SCREEN)
+    sys.stdout.flush()
 
 def load_stats():
+    stats = None
     if os.path.exists(STATS_FILE):
         try:
-            with open(STATS_FILE, "r") as f:
-                return json.load(f)
+            with open(STATS_FILE, "rb") as f:
+                data = f.read()
+            stats = orjson.loads(data) if orjson else json.loads(data)
         except json.decoder.JSONDecodeError:
             # If the file exists but cannot be parsed as JSON, delete it
             os.remove(STATS_FILE)
-    return {char: {"correct": 0, "incorrect": 0, "avg_time": None} for char in mkhedruli_alphabet}
+    if stats is None:
+        stats = {char: {"correct": 0, "incorrect": 0, "avg_time": None} for char in mkhedruli_alphabet}
+    replay_stats_log(stats)
+    return stats
 
 def save_stats(stats):
-    with open(STATS_FILE, "w") as f:
-        json.dump(stats, f, ensure_ascii=False, indent=4)
-
-def calculate_error_rates(stats, exponent=0.5, default_error_rate=0.5):
-    error_rates = {}
-    for char, stat in stats.items():
-        total_attempts = stat["correct"] + stat["incorrect"]
-        if total_attempts > 0:
-            error_rates[char] = (stat["incorrect"] / total_attempts) ** exponent
-        else:
-            error_rates[char] = default_error_rate
-    return error_rates
+    if orjson:
+        with open(STATS_FILE, "wb") as f:
+            f.write(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
+    else:
+        with open(STATS_FILE, "w") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=4)
+
+def replay_stats_log(stats):
+    # Answers logged since the last save_stats, e.g. if the previous session
+    # was killed before it could write the JSON file
+    if not os.path.exists(STATS_LOG):
+        return
+    with open(STATS_LOG, "r") as f:
+        for line in f:
+            try:
+                char, correct, incorrect, avg_time = line.rstrip("\n").split("\t")
+                stat = stats[char]
+                stat["correct"] = int(correct)
+                stat["incorrect"] = int(incorrect)
+                if avg_time:
+                    stat["avg_time"] = float(avg_time)
+            except (ValueError, KeyError):
+                # Skip lines torn by an interrupted write
+                continue
+
+def log_answer(log, character, stat):
+    # Absolute values rather than deltas, so replaying a log that was already
+    # folded into the JSON file is harmless
+    avg_time = stat.get("avg_time")
+    log.write(f"{character}\t{stat['correct']}\t{stat['incorrect']}\t"
+              f"{'' if avg_time is None else avg_time}\n")
+
+def error_rate(stat, exponent=0.5, default_error_rate=0.5):
+    total_attempts = stat["correct"] + stat["incorrect"]
+    if total_attempts > 0:
+        return (stat["incorrect"] / total_attempts) ** exponent
+    return default_error_rate
+
+def max_avg_time(stats):
+    return max(stat.get("avg_time") or 0 for stat in stats.values())
+
+def update_max_avg_time(stats, top_avg_time, old_avg_time, new_avg_time):
+    if new_avg_time >= top_avg_time:
+        return new_avg_time
+    if old_avg_time == top_avg_time:
+        # The slowest character got faster, so another one may be slowest now
+        return max_avg_time(stats)
+    return top_avg_time
+
+def character_weight(stat, top_avg_time, exponent=0.5, time_factor=0.1):
+    weight = error_rate(stat, exponent=exponent)
+    if top_avg_time:
+        weight += ((stat.get("avg_time") or 0) / top_avg_time) ** time_factor
+    return weight
+
+def build_weight_tree(weights):
+    # Fenwick tree over the weights: tree[i] holds the sum of the
+    # i & -i weights ending at weights[i - 1]
+    tree = [0.0] + weights
+    for i in range(1, len(tree)):
+        parent = i + (i & -i)
+        if parent < len(tree):
+            tree[parent] += tree[i]
+    return tree
+
+def calculate_weights(stats, top_avg_time):
+    weights = [character_weight(stats[char], top_avg_time) for char in CHARS]
+    return weights, build_weight_tree(weights)
+
+def set_weight(weights, weight_tree, idx, weight):
+    delta = weight - weights[idx]
+    if not delta:
+        return
+    weights[idx] = weight
+    i = idx + 1
+    while i < len(weight_tree):
+        weight_tree[i] += delta
+        i += i & -i
+
+def total_weight(weight_tree):
+    total = 0.0
+    i = len(weight_tree) - 1
+    while i:
+        total += weight_tree[i]
+        i &= i - 1
+    return total
 
-def weighted_random_choice(items, weights):
-    return random.choices(items, weights, k=1)[0]
+def choose_character(weight_tree):
+    # Walk down the tree to the first character whose prefix sum exceeds
+    # the target, skipping whole subtrees that lie below it
+    target = random.random() * total_weight(weight_tree)
+    pos = 0
+    step = WEIGHT_TREE_TOP_STEP
+    while step:
+        nxt = pos + step
+        if nxt < len(weight_tree) and weight_tree[nxt] <= target:
+            pos = nxt
+            target -= weight_tree[nxt]
+        step >>= 1
+    return CHARS[min(pos, len(CHARS) - 1)]
 
-def choose_character(stats, exponent=0.5, time_factor=0.1):
-    error_rates = calculate_error_rates(stats, exponent=exponent)
-    max_avg_time = max([stat.get("avg_time", 0) for stat in stats.values()])
-    avg_times = {char: (stat.get("avg_time", 0) / max_avg_time) ** time_factor for char, stat in stats.items()}
-    weights = [error_rates[char] + avg_times[char] for char in mkhedruli_alphabet.keys()]
-    return weighted_random_choice(list(mkhedruli_alphabet.keys()), weights)
+def sample_incorrect_names(correct_idx, count):
+    # Draw from every index but the correct one by shifting the upper part
+    # of the range up by one, so no filtered copy of the names is built.
+    return [NAMES[i + (i >= correct_idx)] for i in random.sample(range(len(NAMES) - 1), count)]
 
 def show_question(character, options):
-    clear_screen()
-    print(f"[ Press {EXIT_KEY} to save stats and quit ]\n")
-    print(f"Identify the name of the following Georgian character:\n\n{character}\n")
-    if DISPLAY_OPTIONS_HORIZONTALLY:
-        option_strings = [f"{i+1}. {option}" for i, option in enumerate(options)]
-        print("  ".join(option_strings))
-    else:
-        for i, option in enumerate(options):
-            print(f"{i+1}. {option}")
+    option_strings = [f"{i+1}. {option}" for i, option in enumerate(options)]
+    separator = "  " if DISPLAY_OPTIONS_HORIZONTALLY else "\n"
+    sys.stdout.write(f"{CLEAR_SCREEN}[ Press {EXIT_KEY} to save stats and quit ]\n\n"
+                     f"Identify the name of the following Georgian character:\n\n{character}\n\n"
+                     f"{separator.join(option_strings)}\n")
+    sys.stdout.flush()
 
 def blink(color, character, stats, time_diff):
     if color == "green":
@@ -118,64 +220,79 @@ def blink(color, character, stats, time_diff):
         print("\033[31mIncorrect.\033[0m")
     time.sleep(1.5)
 
-def getch():
+def enter_cbreak_mode():
+    # Switch the terminal once per session rather than around every key
+    # press; cbreak instead of raw keeps newline translation for output.
     fd = sys.stdin.fileno()
     old_settings = termios.tcgetattr(fd)
-    try:
-        tty.setraw(sys.stdin.fileno())
-        ch = sys.stdin.read(1)
-        if ch == EXIT_KEY:
-            clear_screen()
-            sys.exit(0)
-    finally:
-        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return ch
+    tty.setcbreak(fd)
+    atexit.register(termios.tcsetattr, fd, termios.TCSADRAIN, old_settings)
+
+def getch():
+    return sys.stdin.read(1)
 
 def main():
+    enter_cbreak_mode()
     stats = load_stats()
+    top_avg_time = max_avg_time(stats)
+    weights, weight_tree = calculate_weights(stats, top_avg_time)
 
-    while True:
-        character = choose_character(stats)
-        correct_name = mkhedruli_alphabet[character]
-        incorrect_names = random.sample([name for name in mkhedruli_alphabet.values() if name != correct_name], num_options - 1)
-        options = [correct_name] + incorrect_names
-        random.shuffle(options)
-
-        show_question(character, options)
-
-        start_time = time.time()
-        answer = ""
-        while not answer.isdigit() or not (1 <= int(answer) <= num_options):
-            answer = getch()
-        end_time = time.time()
-
-        if answer == EXIT_KEY:
-            break
-        elif options[int(answer)-1] == correct_name:
-            time_diff = round(end_time - start_time, 2)
-            if "avg_time" not in stats[character]:
-                stats[character]["avg_time"] = None
-            if stats[character]["avg_time"] is None:
-                stats[character]["avg_time"] = time_diff
-            else:
-                prev_avg_time = stats[character]["avg_time"]
-                stats[character]["avg_time"] = round((prev_avg_time + time_diff) / 2, 2)
-            stats[character]["correct"] += 1
-            answered_correctly = True
-            blink("green", character, stats, time_diff)
-        else:
-            stats[character]["incorrect"] += 1
-            answered_correctly = False
-            blink("red", character, stats, 0)
+    with open(STATS_LOG, "a", buffering=1) as log:
+        try:
+            while True:
+                character = choose_character(weight_tree)
+                idx = CHAR_TO_IDX[character]
+                correct_name = NAMES[idx]
+                incorrect_names = sample_incorrect_names(idx, num_options - 1)
+                options = [correct_name] + incorrect_names
+                random.shuffle(options)
+
+                show_question(character, options)
+                # Drop keys typed during the previous feedback pause, as the
+                # per-read setraw used to, so they cannot answer this question
+                termios.tcflush(sys.stdin.fileno(), termios.TCIFLUSH)
+
+                start_time = time.perf_counter()
+                answer = getch()
+                while answer not in VALID_KEYS and answer != EXIT_KEY:
+                    answer = getch()
+                end_time = time.perf_counter()
+                entry = stats[character]
+                old_avg_time = entry.get("avg_time") or 0
 
-        if answer == EXIT_KEY:
-            break
+                if answer == EXIT_KEY:
+                    break
 
-        if answered_correctly:
+                if options[ord(answer) - ord("1")] == correct_name:
+                    time_diff = round(end_time - start_time, 2)
+                    prev_avg_time = entry.get("avg_time")
+                    if prev_avg_time is None:
+                        entry["avg_time"] = time_diff
+                    else:
+                        entry["avg_time"] = round((prev_avg_time + time_diff) / 2, 2)
+                    entry["correct"] += 1
+                    blink("green", character, stats, time_diff)
+                else:
+                    entry["incorrect"] += 1
+                    blink("red", character, stats, 0)
+
+                log_answer(log, character, entry)
+
+                # The time term is normalised by the slowest character, so a new
+                # maximum shifts every weight; otherwise only this one changed.
+                new_top_avg_time = update_max_avg_time(stats, top_avg_time, old_avg_time,
+                                                       entry.get("avg_time") or 0)
+                if new_top_avg_time != top_avg_time:
+                    top_avg_time = new_top_avg_time
+                    weights, weight_tree = calculate_weights(stats, top_avg_time)
+                else:
+                    set_weight(weights, weight_tree, idx,
+                               character_weight(entry, top_avg_time))
+        finally:
             save_stats(stats)
+            log.truncate(0)
 
-    save_stats(stats)
-    sys.exit(0)
+    clear_screen()
 
 if __name__ == "__main__":
     main()